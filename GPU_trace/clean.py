@@ -1,17 +1,56 @@
 #!/usr/bin/python3
 
 import re
-import csv
 import os
 import argparse
-import cxxfilt
+import functools
 
-def get_function_name(mangled: str) -> str:
-    try:
-        demangled = cxxfilt.demangle(mangled)
-    except Exception:
-        # If demangling fails, return the original mangled name.
-        return mangled
+# Regex pattern:
+# Group1: event type (any text before '[')
+# Group2: first time value inside []
+# Group3: second time value inside []
+# Group4: duration (number following "duration")
+# Group5: event name (text in quotes)
+pattern = re.compile(rb'^(.*?)\s*\[\s*([^,\]]+)\s*,\s*([^\]]+)\s*\]\s*duration\s*([0-9]+),\s*"([^"]+)"')
+
+def parse_line(line):
+    """
+    Split a raw CUPTI activity line (bytes) into decoded
+    (event type, time start, time end, duration, event name).
+    Uses plain bytes.find slicing; lines that do not fit the expected layout
+    fall back to the regex. Returns None if the line is not an event.
+    """
+    lb = line.find(b'[')
+    comma = line.find(b',', lb) if lb != -1 else -1
+    rb = line.find(b']', comma) if comma != -1 else -1
+    dur_pos = line.find(b'duration', rb) if rb != -1 else -1
+    q1 = line.find(b'"', dur_pos) if dur_pos != -1 else -1
+    q2 = line.find(b'"', q1 + 1) if q1 != -1 else -1
+    if q2 == -1:
+        # The regex needs all of these delimiters in this order, so a line
+        # missing any of them cannot match on the slow path either
+        return None
+    # A second comma inside the brackets is not a [start, end] pair (the
+    # unquoted time field would shift the output CSV columns); such lines go
+    # to the slow path, which may still match at a later '['
+    if (q2 > q1 + 1 and comma > lb + 1 and rb > comma + 1
+            and line.find(b']', lb, comma) == -1 and line.find(b',', comma + 1, rb) == -1
+            and not line[rb + 1:dur_pos].strip()):
+        duration = line[dur_pos + 8:q1].rstrip()
+        if duration.endswith(b','):
+            duration = duration[:-1].lstrip()
+            if duration.isdigit():
+                return (line[:lb].strip().decode(), line[lb + 1:comma].strip().decode(),
+                        line[comma + 1:rb].strip().decode(), duration.decode(),
+                        line[q1 + 1:q2].strip().decode())
+    # Slow path: anything the slicing above could not handle
+    match = pattern.search(line)
+    if not match or b',' in match.group(3):
+        return None
+    return tuple(group.strip().decode() for group in match.groups())
+
+def _strip_signature(demangled: str) -> str:
+    """Reduce a demangled symbol to its bare function name."""
     # Find the first occurrence of '<' or '(' (if any) to isolate the function signature.
     lt_index = demangled.find('<')
     paren_index = demangled.find('(')
@@ -24,6 +63,24 @@ def get_function_name(mangled: str) -> str:
     name = name_with_type.split()[-1]
     return name
 
+# Kernels are launched thousands of times under the same mangled name,
+# so the result is cached per symbol.
+@functools.lru_cache(maxsize=None)
+def get_function_name(mangled: str) -> str:
+    # Only Itanium-mangled symbols need demangling; plain driver/runtime
+    # API names such as "cuDeviceGet" are passed through as-is.
+    if not mangled.startswith('_Z'):
+        return _strip_signature(mangled)
+    # Imported here so that parse_line can be reused (see
+    # clean_fluidsGL_cupti.py) without requiring cxxfilt
+    import cxxfilt
+    try:
+        demangled = cxxfilt.demangle(mangled)
+    except Exception:
+        # If demangling fails, return the original mangled name.
+        return mangled
+    return _strip_signature(demangled)
+
 def main():
     parser = argparse.ArgumentParser(description="Clean GPU trace file.")
     parser.add_argument("input_file", help="Path to the input file")
@@ -35,31 +92,24 @@ def main():
     name, _ = os.path.splitext(basename)
     output_file = os.path.join(directory, f"{name}_clean.csv")
 
-    # Regex pattern:
-    # Group1: event type (any text before '[')
-    # Group2: first time value inside []
-    # Group3: second time value inside []
-    # Group4: duration (number following "duration")
-    # Group5: event name (text in quotes)
-    pattern = re.compile(r'^(.*?)\s*\[\s*([^,\]]+)\s*,\s*([^\]]+)\s*\]\s*duration\s*([0-9]+),\s*"([^"]+)"')
-
-    with open(input_file, "r") as fin, open(output_file, "w", newline="") as fout:
-        writer = csv.writer(fout)
-        writer.writerow(["EventType", "TimeStart", "TimeEnd", "Duration", "EventName"])
+    # The trace is read as raw bytes with a large buffer; only the captured
+    # fields of matching lines are decoded. The fields are plain numbers and
+    # identifiers, so rows are formatted directly instead of via csv.writer;
+    # only the event name is quoted.
+    with open(input_file, "rb", buffering=1 << 20) as fin, \
+            open(output_file, "w", newline="", buffering=1 << 20) as fout:
+        fout.write("EventType,TimeStart,TimeEnd,Duration,EventName\n")
         for line in fin:
-            line = line.strip()
-            if not line:
+            # Cheap substring test first: most lines (grid/block/device details)
+            # are not events, so skip parse_line for them entirely.
+            if b"duration" not in line:
                 continue
-            match = pattern.search(line)
-            if match:
-                event_type = match.group(1).strip()
-                time_start = match.group(2).strip()
-                time_end = match.group(3).strip()
-                duration = match.group(4).strip()
-                event_name = match.group(5).strip()
+            fields = parse_line(line)
+            if fields:
+                event_type, time_start, time_end, duration, event_name = fields
                 # Demangle the event name and remove any return type.
                 event_name = get_function_name(event_name)
-                writer.writerow([event_type, time_start, time_end, duration, event_name])
+                fout.write(f'{event_type},{time_start},{time_end},{duration},"{event_name}"\n')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
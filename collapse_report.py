@@ -4,9 +4,13 @@ import os
 import argparse
 import configparser
 import csv
+import itertools
 from collections import defaultdict
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
 def arg_file(arg):
@@ -80,28 +84,29 @@ def read_gpu_records(csv_path):
     with open(csv_path, newline='') as csvfile:
         reader = csv.reader(csvfile)
         header = next(reader)  # Skip header row
-        # First, gather all rows into a list to compute the minimum timestart
-        rows_list = [row for row in reader if len(row) >= 5]
-        if not rows_list:
-            return records
-        # Compute the minimum timestart value (in nanoseconds)
-        t_min = min(float(row[1]) for row in rows_list)
-        for row in rows_list:
+        # Single streaming pass: keep absolute times while tracking the
+        # minimum timestart, instead of buffering every raw row first
+        t_min = None
+        for row in reader:
+            if len(row) < 5:
+                continue  # skip malformed rows
             timestart_ns = float(row[1])
-            timeend_ns = float(row[2])
-            # Convert nanoseconds to seconds relative to t_min
-            t_start_sec = (timestart_ns - t_min) / 1e9
-            t_end_sec = (timeend_ns - t_min) / 1e9
+            if t_min is None or timestart_ns < t_min:
+                t_min = timestart_ns
             # Convert duration from nanoseconds to seconds
             duration_sec = float(row[3]) / 1e9
             r = {
             'Eventtype': row[0],
-            'timestart': t_start_sec,
-            'timeend': t_end_sec,
+            'timestart': timestart_ns,
+            'timeend': float(row[2]),
             'duration': duration_sec,
             'eventname': row[4]
             }
             records.append(r)
+    # Convert nanoseconds to seconds relative to t_min
+    for r in records:
+        r['timestart'] = (r['timestart'] - t_min) / 1e9
+        r['timeend'] = (r['timeend'] - t_min) / 1e9
     return records
 
 def handle_gpu_records(records_cpu, records_gpu):
@@ -111,35 +116,68 @@ def handle_gpu_records(records_cpu, records_gpu):
     })
     # print(records_gpu[:10])
     
-    df_gpu = pd.DataFrame({
-        'timestart': [record['timestart'] for record in records_gpu],
-        'event': ["GPU;" + record['Eventtype'] + ";" + record['eventname'] for record in records_gpu],
-        'duration': [record['duration'] for record in records_gpu],
-    })
+    # GPU events are only searched, never returned, so keep them as plain arrays
+    gpu_start = np.fromiter((record['timestart'] for record in records_gpu),
+                            dtype=np.float64, count=len(records_gpu))
+    gpu_duration = np.fromiter((record['duration'] for record in records_gpu),
+                               dtype=np.float64, count=len(records_gpu))
+    gpu_event = np.array(["GPU;" + record['Eventtype'] + ";" + record['eventname'] for record in records_gpu],
+                         dtype=object)
     
     # Compute the end time for GPU events
-    df_gpu['end'] = df_gpu['timestart'] + df_gpu['duration']
+    gpu_end = gpu_start + gpu_duration
     
-    # Compute the next timestamp for each CPU row
-    df_cpu['next_timestamp'] = df_cpu['Timestamp'].shift(-1)
-    
-    def find_events(row):
-        ts = float(row['Timestamp'])
-        # For the last row, use current timestamp as the interval end
-        next_ts = float(row['next_timestamp']) if pd.notna(row['next_timestamp']) else ts
-        # Find GPU events overlapping the interval [ts, next_ts]
-        matching = df_gpu[(df_gpu['timestart'] < next_ts) & (df_gpu['end'] > ts)]
-        return '|'.join(matching['event'].tolist()) if not matching.empty else ''
+    # Interval join: CPU row i covers [ts, next_ts], where next_ts is the
+    # timestamp of the next row in file order (the last row uses its own
+    # timestamp as the interval end), and collects every GPU event with
+    # timestart < next_ts and end > ts.
+    cpu_ts = np.fromiter((float(record['timestamp']) for record in records_cpu),
+                         dtype=np.float64, count=len(records_cpu))
+    next_ts = np.append(cpu_ts[1:], cpu_ts[-1:])
+    if np.all(np.diff(cpu_ts) >= 0):
+        # With the CPU timestamps in order, the matching rows for one GPU
+        # event form a contiguous range found by binary search, instead of
+        # scanning every GPU event for every CPU row
+        i_start = np.searchsorted(next_ts, gpu_start, side='right')
+        i_end = np.searchsorted(cpu_ts, gpu_end, side='left')
+        
+        # Expand every (GPU event, CPU row) hit with NumPy instead of a Python loop
+        counts = np.clip(i_end - i_start, 0, None)
+        gpu_idx = np.repeat(np.arange(len(gpu_event)), counts)
+        range_starts = np.cumsum(counts) - counts
+        cpu_idx = np.arange(counts.sum()) - np.repeat(range_starts, counts) + np.repeat(i_start, counts)
+    else:
+        # Out-of-order samples break the binary search, so test every GPU
+        # event against each CPU row
+        matches = [np.nonzero((gpu_start < nts) & (gpu_end > ts))[0] for ts, nts in zip(cpu_ts, next_ts)]
+        cpu_idx = np.repeat(np.arange(len(cpu_ts)), [len(m) for m in matches])
+        gpu_idx = np.concatenate(matches)
     
-    df_cpu['events'] = df_cpu.apply(find_events, axis=1)
+    # CSR layout grouped by CPU row; the stable sort keeps GPU events in their
+    # original order within a row, as a full scan would produce
+    by_cpu = np.argsort(cpu_idx, kind='stable')
+    hit_events = gpu_event[gpu_idx[by_cpu]]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(cpu_idx, minlength=len(df_cpu)))))
+    df_cpu['events'] = ['|'.join(hit_events[offsets[i]:offsets[i + 1]]) for i in range(len(df_cpu))]
     
-    # Continue with further processing using df_cpu and df_gpu as needed
+    # Continue with further processing using df_cpu as needed
     
     print("GPU records processed.")
     # print(df_cpu.head())  # Display first few rows of df_cpu for verification
     
     return df_cpu
 
+# Cache of reversed callchains; the sampler reports the same stacks over and over
+_callchain_cache = {}
+
+def reverse_callchain(callchain):
+    """Reverse a ';'-separated callchain into root-first order, dropping the trailing empty frame."""
+    processed_chain = _callchain_cache.get(callchain)
+    if processed_chain is None:
+        processed_chain = ';'.join(callchain.split(';')[:-1][::-1])
+        _callchain_cache[callchain] = processed_chain
+    return processed_chain
+
 def process_records(records, scinot):
     """
     Process CSV records to extract timestamps, CPU power consumption,
@@ -150,44 +188,50 @@ def process_records(records, scinot):
       - Effective CPU power = (resource_util / 100) * total_power.
       - Overall effective power = effective CPU power + gpu_power.
     """
-    if not records:
+    # Records are consumed in a single streaming pass, so any iterable works
+    it = iter(records)
+    first = next(it, None)
+    if first is None:
         raise ValueError("No records found in CSV file.")
 
-    first_timestamp = float(records[0]['timestamp'])
     timestamps = []
     total_power_series = []
-    effective_power_series = []
+    resource_util_series = []
     gpu_power_series = []
-    effective_cpu_series = []
+    # Records without any '|' carry no callchains, so only the rest are kept
+    chain_rows = []
+    chain_strs = []
+
+    for i, record in enumerate(itertools.chain([first], it)):
+        timestamps.append(record['timestamp'])
+        total_power_series.append(record['total_power'])
+        resource_util_series.append(record['resource_util'])
+        gpu_power_series.append(record['gpu_power'])
+
+        callchain_str = record['metadata']['callchain']
+        if '|' in callchain_str:
+            chain_rows.append(i)
+            chain_strs.append(callchain_str)
+
+    # Convert the collected columns once and do the arithmetic on whole arrays
+    timestamps = np.array(timestamps, dtype=np.float64)
+    # Elapsed timestamps relative to the first record
+    timestamps -= timestamps[0]
+    total_power_series = np.array(total_power_series, dtype=np.float64)
+    resource_util_series = np.array(resource_util_series, dtype=np.float64)
+    gpu_power_series = np.array(gpu_power_series, dtype=np.float64)
+    effective_cpu_series = (resource_util_series / 100.0) * total_power_series
+    effective_power_series = effective_cpu_series + gpu_power_series
+
     callchain_power = defaultdict(float)
     callchain_num = defaultdict(int)
-
-    for record in records:
-        current_time = float(record['timestamp'])
-        timestamps.append(current_time - first_timestamp)
-        
-        total_power = float(record['total_power'])
-        total_power_series.append(total_power)
-        
-        resource_util = float(record['resource_util'])
-        effective_cpu = (resource_util / 100.0) * total_power
-        effective_cpu_series.append(effective_cpu)
-        
-        gpu_power = float(record['gpu_power'])
-        gpu_power_series.append(gpu_power)
-        
-        overall_effective = effective_cpu + gpu_power
-        effective_power_series.append(overall_effective)
-        
+    for overall_effective, callchain_str in zip(effective_power_series[chain_rows].tolist(), chain_strs):
         # Process callchains: split and ignore the last empty element
-        callchain_str = record['metadata']['callchain']
         callchains = callchain_str.split('|')[0:-1]
-        if len(callchains) == 0:
-            continue
         # Distribute overall effective power equally among callchains
         ppc = overall_effective / len(callchains)
         for callchain in callchains:
-            processed_chain = ';'.join(callchain.split(';')[:-1][::-1])
+            processed_chain = reverse_callchain(callchain)
             callchain_power[processed_chain] += ppc
             callchain_num[processed_chain] += 1
 
@@ -201,40 +245,34 @@ def process_gpu_records(records):
     """
     Process GPU records to extract timestamps, GPU power consumption, and aggregate GPU callchain data.
     For each record:
-      - GPU power is taken from the second column.
-      - Callchains are extracted from the fourth column (events) by splitting on '|'.
+      - GPU power is taken from the 'GPU Power' column.
+      - Callchains are extracted from the 'events' column by splitting on '|'.
       - The GPU power is distributed equally among all callchains.
     """
     if records.empty:
         raise ValueError("No records found in GPU CSV file.")
 
-    timestamps = []
-    gpu_power_series = []
+    # Work on the plain column arrays rather than Series rows
+    events = records['events'].to_numpy(dtype=object)
+    gpu_power = records['GPU Power'].to_numpy(dtype=np.float64)
+    # Rows without any overlapping GPU event carry an empty string
+    has_events = events != ''
+
     gpu_callchain_power = defaultdict(float)
     gpu_callchain_count = defaultdict(int)
-
-    for index, row in records.iterrows():
-        # Assume columns: 0: timestamp, 1: GPU Power, 3: events
-        timestamp = float(row.iloc[0])
-        timestamps.append(timestamp)
-
-        gpu_power = float(row.iloc[1])
-        gpu_power_series.append(gpu_power)
-
-        events_str = row.iloc[3]
+    for power, events_str in zip(gpu_power[has_events].tolist(), events[has_events]):
         callchains = events_str.split('|')
         # Remove the last empty element if present
-        if callchains and callchains[-1] == '':
+        if callchains[-1] == '':
             callchains = callchains[:-1]
         if len(callchains) == 0:
             continue
         # Distribute GPU power equally among all callchains
-        ppc = gpu_power / len(callchains)
+        ppc = power / len(callchains)
         for chain in callchains:
             gpu_callchain_power[chain] += ppc
             gpu_callchain_count[chain] += 1
 
-    # print(gpu_callchain_power)
     return gpu_callchain_power, gpu_callchain_count
 
 def write_collapsed_files(target, directory, callchain_power, callchain_num, gpu_callchain_power, gpu_callchain_count):
@@ -246,75 +284,70 @@ def write_collapsed_files(target, directory, callchain_power, callchain_num, gpu
     # Write energy data (includes both CPU and GPU power)
     filename_energy = f'{target}_energy.collapsed'
     file_path_energy = os.path.join(directory, filename_energy)
-    with open(file_path_energy, 'w') as file:
-        for callchain, power in gpu_callchain_power.items():
-            file.write(f'{target};{callchain} {power}\n')
-        for callchain, power in callchain_power.items():
-            file.write(f'{target};CPU;{callchain} {power}\n')
+    lines = [f'{target};{callchain} {power}\n' for callchain, power in gpu_callchain_power.items()]
+    lines += [f'{target};CPU;{callchain} {power}\n' for callchain, power in callchain_power.items()]
+    # Encode once and hand the whole buffer to a single write call
+    with open(file_path_energy, 'wb', buffering=1 << 20) as file:
+        file.write(''.join(lines).encode())
 
     # Write CPU (number of calls) data
     filename_cpu = f'{target}_cpu.collapsed'
     file_path_cpu = os.path.join(directory, filename_cpu)
-    with open(file_path_cpu, 'w') as file:
-        for callchain, count in gpu_callchain_count.items():
-            file.write(f'{target};{callchain} {count}\n')
-        for callchain, num in callchain_num.items():
-            file.write(f'{target};CPU;{callchain} {num}\n')
+    lines = [f'{target};{callchain} {count}\n' for callchain, count in gpu_callchain_count.items()]
+    lines += [f'{target};CPU;{callchain} {num}\n' for callchain, num in callchain_num.items()]
+    with open(file_path_cpu, 'wb', buffering=1 << 20) as file:
+        file.write(''.join(lines).encode())
 
-def plot_power_consumption(timestamps, total_power_series, directory, target):
+def plot_power_consumption(fig, ax, timestamps, total_power_series, directory, target):
     """Plot total CPU power consumption over time and save to an SVG file."""
-    plt.figure(figsize=(12, 6))
-    plt.plot(timestamps, total_power_series)
-    plt.xlabel('Timestamp (seconds)')
-    plt.ylabel('Total CPU Power Consumption (watts)')
-    plt.title('Total CPU Power Consumption over Time')
+    ax.clear()
+    ax.plot(timestamps, total_power_series)
+    ax.set_xlabel('Timestamp (seconds)')
+    ax.set_ylabel('Total CPU Power Consumption (watts)')
+    ax.set_title('Total CPU Power Consumption over Time')
     filename = f'{target}_power_consumption.svg'
     filepath = os.path.join(directory, filename)
-    plt.savefig(filepath)
-    plt.close()
+    fig.savefig(filepath)
 
-def plot_effective_power(timestamps, effective_power_series, directory, target):
+def plot_effective_power(fig, ax, timestamps, effective_power_series, directory, target):
     """
     Plot effective power consumption (CPU+GPU) over time and save to an SVG file.
     """
-    plt.figure(figsize=(12, 6))
-    plt.plot(timestamps, effective_power_series, label='Effective (CPU+GPU) Power', color='orange')
-    plt.xlabel('Timestamp (seconds)')
-    plt.ylabel('Effective Power Consumption (watts)')
-    plt.title('Effective (CPU+GPU) Power Consumption over Time')
-    plt.legend()
+    ax.clear()
+    ax.plot(timestamps, effective_power_series, label='Effective (CPU+GPU) Power', color='orange')
+    ax.set_xlabel('Timestamp (seconds)')
+    ax.set_ylabel('Effective Power Consumption (watts)')
+    ax.set_title('Effective (CPU+GPU) Power Consumption over Time')
+    ax.legend()
     filename = f'{target}_effective.svg'
     filepath = os.path.join(directory, filename)
-    plt.savefig(filepath)
-    plt.close()
+    fig.savefig(filepath)
 
-def plot_effective_cpu_power(timestamps, effective_cpu_series, directory, target):
+def plot_effective_cpu_power(fig, ax, timestamps, effective_cpu_series, directory, target):
     """
     Plot effective CPU power consumption over time and save to an SVG file.
     """
-    plt.figure(figsize=(12, 6))
-    plt.plot(timestamps, effective_cpu_series, label='Effective CPU Power', color='red')
-    plt.xlabel('Timestamp (seconds)')
-    plt.ylabel('Effective CPU Power (watts)')
-    plt.title('Effective CPU Power Consumption over Time')
-    plt.legend()
+    ax.clear()
+    ax.plot(timestamps, effective_cpu_series, label='Effective CPU Power', color='red')
+    ax.set_xlabel('Timestamp (seconds)')
+    ax.set_ylabel('Effective CPU Power (watts)')
+    ax.set_title('Effective CPU Power Consumption over Time')
+    ax.legend()
     filename = f'{target}_rapl.svg'
     filepath = os.path.join(directory, filename)
-    plt.savefig(filepath)
-    plt.close()
+    fig.savefig(filepath)
 
-def plot_gpu_power(timestamps, gpu_power_series, directory, target):
+def plot_gpu_power(fig, ax, timestamps, gpu_power_series, directory, target):
     """Plot GPU power consumption over time and save to an SVG file."""
-    plt.figure(figsize=(12, 6))
-    plt.plot(timestamps, gpu_power_series, label='GPU Power', color='green')
-    plt.xlabel('Timestamp (seconds)')
-    plt.ylabel('GPU Power Consumption (watts)')
-    plt.title('GPU Power Consumption over Time')
-    plt.legend()
+    ax.clear()
+    ax.plot(timestamps, gpu_power_series, label='GPU Power', color='green')
+    ax.set_xlabel('Timestamp (seconds)')
+    ax.set_ylabel('GPU Power Consumption (watts)')
+    ax.set_title('GPU Power Consumption over Time')
+    ax.legend()
     filename = f'{target}_gpu_power.svg'
     filepath = os.path.join(directory, filename)
-    plt.savefig(filepath)
-    plt.close()
+    fig.savefig(filepath)
 
 def ensure_directory(target):
     """Create directory for saving results if it does not exist."""
@@ -353,17 +386,23 @@ def main():
     # Write collapsed data files
     write_collapsed_files(target_clean, directory, callchain_power, callchain_num, gpu_callchain_power, gpu_callchain_count)
 
+    # All plots share one figure on the non-interactive Agg backend;
+    # each plot function clears the axes before drawing
+    fig, ax = plt.subplots(figsize=(12, 6))
+
     # Plot total CPU power consumption over time
-    plot_power_consumption(timestamps, total_power_series, directory, target_clean)
+    plot_power_consumption(fig, ax, timestamps, total_power_series, directory, target_clean)
 
     # Plot effective CPU power consumption over time
-    plot_effective_cpu_power(timestamps, effective_cpu_series, directory, target_clean)
+    plot_effective_cpu_power(fig, ax, timestamps, effective_cpu_series, directory, target_clean)
 
     # Plot effective (CPU+GPU) power consumption over time
-    plot_effective_power(timestamps, effective_power_series, directory, target_clean)
+    plot_effective_power(fig, ax, timestamps, effective_power_series, directory, target_clean)
     
     # Plot GPU power consumption over time
-    plot_gpu_power(timestamps, gpu_power_series, directory, target_clean)
+    plot_gpu_power(fig, ax, timestamps, gpu_power_series, directory, target_clean)
+
+    plt.close(fig)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file